@@ -1,25 +1,37 @@
 from yeelight import Bulb, BulbException
 from datetime import datetime, timedelta, time
+from time import monotonic
 from collections.abc import Callable
-from typing import cast, Literal
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Literal
 from dataclasses import dataclass, asdict
+from functools import cached_property, partial
 import requests
+from requests.adapters import HTTPAdapter
 import tkinter as tk
 from tkinter import Misc, ttk, messagebox
 import json
 import os 
-import re
+import ipaddress
+import threading
 
 BULB_IP = "192.168.0.18"
 URL = "https://api.sunrisesunset.io/json?"
 GEOCODING_URL = "https://geocoding-api.open-meteo.com/v1/search"
-
-def add_subtract_minutes(time: str, minutes: str) -> str:
-    ''' Return time string in "%H:%M" format after adding or subtracting minutes to given time in the same format '''
-    time_obj: datetime = datetime.strptime(time, "%H:%M")
-    new_time: datetime = time_obj + timedelta(minutes=int(minutes))
-        
-    return new_time.strftime("%H:%M")
+GEOCACHE_PATH = "geocache.json"
+SUNSET_CACHE_PATH = "sunset_cache.json"
+SUNSET_PLACEHOLDER = "--:--"
+SUNSET_FAILED = "unavailable"
+SUNSET_RETRY_S = 60 # retry interval in seconds for a failed sunset fetch, e.g. when the app starts before the network is up
+HTTP_TIMEOUT: tuple[float, float] = (3.05, 5) # (connect, read) in seconds, connect just above the 3 s TCP retransmit
+OFF_TIME_VALUES: tuple[str, ...] = tuple(f"{h}:{m:02d}" for h in range(24) for m in range(0, 60, 10))
+
+def write_json_atomic(path: str, data: object) -> None:
+    ''' Write data as json to a temporary file first and then swap it in, so a crash can't leave the file half-written. '''
+    tmp_path: str = path + ".tmp"
+    with open(tmp_path, "w") as file:
+        file.write(json.dumps(data, indent=4))
+    os.replace(tmp_path, path)
 
 def get_target_datetime(target_time: str) -> datetime:
     ''' Return datetime object based on target time string in "%H:%M" format considering that if target time is earlier than current time it is scheduled for the next day. '''
@@ -56,23 +68,120 @@ class HttpRequests:
     def __init__(self) -> None:
         self.sunset_url = URL
         self.geo_url = GEOCODING_URL
+
+        # Keep-alive session, so repeated requests reuse the open TLS connection instead of doing a new handshake every call.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=4)
+        self.session.mount("https://api.sunrisesunset.io", adapter)
+        self.session.mount("https://geocoding-api.open-meteo.com", adapter)
+
+        # Cache files are written from worker threads, one writer at a time
+        self._cache_file_lock = threading.Lock()
+
+        # Geocoding cache: normalized location name -> (latitude, longitude, location name returned by API)
+        self._geo_cache_path: str = GEOCACHE_PATH
+        self._geo_cache: dict[str, tuple[str, str, str]] = self._load_geo_cache()
+
+        # Sunset cache: (latitude, longitude, date) -> sunset time. Sunset changes only once a day.
+        self._sunset_cache_path: str = SUNSET_CACHE_PATH
+        self._sunset_cache: dict[tuple[str, str, str], str] = self._load_sunset_cache()
     
     def get_sunset(self, latitude: str, longitude: str) -> str:
-        ''' Return sunset time in HH:MM format. '''
+        ''' Return sunset time in HH:MM format. Served from cache if it was already fetched today for given coordinates. '''
+        key: tuple[str, str, str] = (latitude, longitude, datetime.now().strftime("%Y-%m-%d"))
+        if key in self._sunset_cache:
+            return self._sunset_cache[key]
         payload: dict[str, str] = {'lat': latitude, 'lng': longitude, 'time_format': '24'}
-        response: requests.Response = requests.get(url=self.sunset_url, params=payload)
-        return response.json()['results']['sunset'][:5]
-
-    def set_location(self, location: str) -> tuple[str, ...] | str:
-        ''' Return latitude, longitude, sunset time for given location, otherwise raise KeyError exception. '''
-        payload: dict[str, str | int] = {"name": location, "count": 1}
-        response: requests.Response = requests.get(url=self.geo_url, params=payload)
-
-        latitude: str = str(response.json()['results'][0]['latitude'])
-        longitude: str = str(response.json()['results'][0]['longitude'])
-        api_location: str = response.json()['results'][0]['name']
-        sunset: str = self.get_sunset(latitude, longitude)
-        return (latitude, longitude, api_location, sunset)
+        response: requests.Response = self.session.get(url=self.sunset_url, params=payload, timeout=HTTP_TIMEOUT)
+        response.raise_for_status()
+        sunset: str = response.json()['results']['sunset'][:5]
+        self._sunset_cache[key] = sunset
+        return sunset
+
+    def geocode(self, location: str) -> tuple[str, str, str]:
+        ''' Return latitude, longitude and location name returned by API for given location, otherwise raise KeyError exception. Results are served from cache if the location was looked up before. '''
+        key: str = self._geo_key(location)
+        latitude: str
+        longitude: str
+        api_location: str
+        if key in self._geo_cache:
+            latitude, longitude, api_location = self._geo_cache[key]
+        else:
+            payload: dict[str, str | int] = {"name": location, "count": 1}
+            response: requests.Response = self.session.get(url=self.geo_url, params=payload, timeout=HTTP_TIMEOUT)
+            response.raise_for_status()
+
+            result: dict[str, str | float] = response.json()['results'][0]
+            latitude = str(result['latitude'])
+            longitude = str(result['longitude'])
+            api_location = str(result['name'])
+            self._geo_cache[key] = (latitude, longitude, api_location)
+            self._save_geo_cache()
+        return (latitude, longitude, api_location)
+
+    def is_geocode_cached(self, location: str) -> bool:
+        ''' Return True if geocode() would serve given location from cache without a request. '''
+        return self._geo_key(location) in self._geo_cache
+
+    def warm_up_sunset(self) -> None:
+        ''' Open a connection to the sunset API ahead of time, so the next get_sunset() call reuses it instead of doing the handshake. '''
+        try:
+            self.session.head(url=self.sunset_url, timeout=HTTP_TIMEOUT)
+        except requests.RequestException:
+            pass # Only an optimization, get_sunset() reports real failures.
+
+    def close(self) -> None:
+        ''' Close pooled connections of the session. '''
+        self.session.close()
+
+    @staticmethod
+    def _geo_key(location: str) -> str:
+        ''' Return geocoding cache key for given location name. '''
+        return location.strip().casefold()
+
+    def _load_geo_cache(self) -> dict[str, tuple[str, str, str]]:
+        ''' Return geocoding cache loaded from a json file if it exists and is valid, otherwise an empty cache. '''
+        try:
+            with open(self._geo_cache_path, "rb") as file:
+                raw: bytes = file.read()
+        except FileNotFoundError:
+            return {}
+        try:
+            data: dict[str, list[str]] = json.loads(raw)
+            return {key: (str(value[0]), str(value[1]), str(value[2])) for key, value in data.items()}
+        except (ValueError, TypeError, KeyError, IndexError, AttributeError):
+            print("Geocoding cache file is corrupted, starting with an empty cache.")
+            return {}
+
+    def _save_geo_cache(self) -> None:
+        ''' Save geocoding cache to a json file. '''
+        with self._cache_file_lock:
+            # Snapshot under the lock, so a newer snapshot can't be overwritten by an older one from another worker thread.
+            data: dict[str, tuple[str, str, str]] = dict(self._geo_cache)
+            write_json_atomic(self._geo_cache_path, data)
+
+    def _load_sunset_cache(self) -> dict[tuple[str, str, str], str]:
+        ''' Return sunset cache loaded from a json file if it exists and is valid, otherwise an empty cache. Entries from previous days are dropped, they can't be hit anymore. '''
+        try:
+            with open(self._sunset_cache_path, "rb") as file:
+                raw: bytes = file.read()
+        except FileNotFoundError:
+            return {}
+        today: str = datetime.now().strftime("%Y-%m-%d")
+        try:
+            data: list[list[str]] = json.loads(raw)
+            return {(str(latitude), str(longitude), day): str(sunset) for latitude, longitude, day, sunset in data if day == today}
+        except (ValueError, TypeError):
+            print("Sunset cache file is corrupted, starting with an empty cache.")
+            return {}
+
+    def save_sunset_cache(self) -> None:
+        ''' Save today's sunset cache entries to a json file as a list of [latitude, longitude, date, sunset] entries. '''
+        today: str = datetime.now().strftime("%Y-%m-%d")
+        with self._cache_file_lock:
+            # Copy items first, the cache can be filled from a worker thread in the meantime.
+            data: list[list[str]] = [[*key, sunset] for key, sunset in list(self._sunset_cache.items()) if key[2] == today]
+            write_json_atomic(self._sunset_cache_path, data)
     
 class LoopController:
     def __init__(self, tk_root: Misc, interval_ms: int, task: Callable[[], None]) -> None:
@@ -86,16 +195,22 @@ class LoopController:
         self.interval: int = interval_ms
         self.task: Callable[[], None] = task
         self._loop_id: str | None = None
+        self._deadline: float = 0.0 # monotonic() time of the next planned run, in seconds
 
     def _start_loop(self) -> None:
         ''' Start the loop by scheduling running the task after interval. '''
+        self._deadline = monotonic() + self.interval / 1000
         self._loop_id = self.root.after(self.interval, self._run_task)
 
     def _run_task(self) -> None:
-        ''' Run task every given interval. '''
+        ''' Run task every given interval. Next run is scheduled against the planned deadline, so task duration and timer lateness don't accumulate as drift. '''
         self.task()
         if self._loop_id:
-            self._loop_id = self.root.after(self.interval, self._run_task)
+            now: float = monotonic()
+            self._deadline += self.interval / 1000
+            if self._deadline < now: # fell behind by more than an interval (e.g. system sleep), don't try to catch up
+                self._deadline = now + self.interval / 1000
+            self._loop_id = self.root.after(int((self._deadline - now) * 1000), self._run_task)
     
     def start(self) -> None:
         ''' Start the loop (only if not running). '''
@@ -111,6 +226,38 @@ class LoopController:
     def is_running(self) -> bool:
         ''' Check if the loop is running. '''
         return self._loop_id is not None
+
+class TimerController:
+    def __init__(self, tk_root: Misc, task: Callable[[], None]) -> None:
+        '''
+        Parameters:
+        - tk_root: Tkinter widget to use ".after()" method on
+        - task: A no-arg callable to execute once at scheduled time
+        '''
+        self.root: Misc = tk_root
+        self.task: Callable[[], None] = task
+        self._timer_id: str | None = None
+
+    def _run_task(self) -> None:
+        ''' Run the task once. '''
+        self._timer_id = None
+        self.task()
+
+    def schedule(self, target: datetime) -> None:
+        ''' Schedule the task to run once at target datetime, replacing previous schedule. If target has already passed, run it as soon as possible. '''
+        self.cancel()
+        delay_ms: int = max(0, int((target - datetime.now()).total_seconds() * 1000))
+        self._timer_id = self.root.after(delay_ms, self._run_task)
+
+    def cancel(self) -> None:
+        ''' Cancel the scheduled task (if it is scheduled). '''
+        if self._timer_id is not None:
+            self.root.after_cancel(self._timer_id)
+            self._timer_id = None
+
+    def is_scheduled(self) -> bool:
+        ''' Check if the task is scheduled. '''
+        return self._timer_id is not None
     
 class ConfigManager:
     ''' Keep configuration attributes. Handle saving and loading configuration from file. '''
@@ -123,42 +270,40 @@ class ConfigManager:
     def save(self) -> None:
         ''' Save configuration attributes to a json file. '''
         data: dict[str, dict[str, str | int | None]] = {"location_config": asdict(self.loc_config), "app_settings": asdict(self.app_settings), "network_settings": asdict(self.network_settings)}
-        with open(self._path, "w") as file:
-            json.dump(data, file, indent=4)
-
-    def load(self) -> None:
-        ''' Load configuration attributes from a json file if it exists, otherwise set to defaults. '''
-        if os.path.exists(self._path):
-            with open(self._path, "r") as file:
-                data: dict[str, dict[str, str | int | None]] = json.load(file)
-            self.loc_config = LocationConfig(**data["location_config"]) # type: ignore # there is no way of int being assigned to str
-            self.app_settings = AppSettings(**data["app_settings"]) # type: ignore # there is no way of int being assigned to str
-            self.network_settings = NetworkSettings(**data["network_settings"]) # type: ignore # there is no way of int being assigned to str or None
-        else:
+        write_json_atomic(self._path, data)
+
+    def load(self) -> bool:
+        ''' Load configuration attributes from a json file if it exists, otherwise set to defaults. Return True if the file was loaded. '''
+        try:
+            with open(self._path, "rb") as file:
+                raw: bytes = file.read()
+        except FileNotFoundError:
             print("Config file not found. Configuration set to default.")
+            return False
+        data: dict[str, dict[str, str | int | None]] = json.loads(raw)
+        self.loc_config = LocationConfig(**data["location_config"]) # type: ignore # there is no way of int being assigned to str
+        self.app_settings = AppSettings(**data["app_settings"]) # type: ignore # there is no way of int being assigned to str
+        self.network_settings = NetworkSettings(**data["network_settings"]) # type: ignore # there is no way of int being assigned to str or None
+        return True
         
 class BulbController:
-    def __init__(self, ip: str | None, state_change_callback_recver: Callable[[str], None] | None = None) -> None:
-        ''' Init the bulb with passed IP address. '''
+    def __init__(self, ip: str | None) -> None:
+        ''' Init the bulb with passed IP address. No network communication happens until connect() is called. '''
         self.ip: str | None = ip
-        self.state_change_callback_recver: Callable[[str], None] | None = state_change_callback_recver
+        self.power_state: str = "off"
         if self.ip:
             self.bulb: Bulb = Bulb(self.ip)
-            self._check_bulb()
-            self.power_state: str = self.get_power_state()
-            self._notify()
 
-    def _notify(self) -> None:
-        ''' Notify the callback listener with bulb's power state. '''
-        if self.state_change_callback_recver:
-            self.state_change_callback_recver(self.power_state)
+    def connect(self) -> None:
+        ''' Check if the bulb is reachable and read its power state. '''
+        if self.ip:
+            self.power_state = self._check_bulb()
 
     def toggle(self) -> None:
-        ''' Toggle the bulb and return it's power state. '''
+        ''' Toggle the bulb and flip its tracked power state without querying the bulb again. '''
         if self.ip:
             self.bulb.toggle()
-            self.power_state = self.get_power_state()
-            self._notify()
+            self.power_state = "off" if self.power_state == "on" else "on"
         else:
             print("Bulb not connected.")
 
@@ -168,7 +313,6 @@ class BulbController:
             if self.power_state == "off":
                 self.bulb.turn_on()
                 self.power_state = "on"
-                self._notify()
         else:
             print("Bulb not connected.")
 
@@ -178,22 +322,21 @@ class BulbController:
             if self.power_state == "on":
                 self.bulb.turn_off()
                 self.power_state = "off"
-                self._notify()
         else:
             print("Bulb not connected.")
 
     def get_power_state(self) -> str:
         ''' Return bulb's power state. If no bulb connected, always return "off" state. '''
         if self.ip:
-            return self.bulb.get_properties()["power"]
+            return self.bulb.get_properties(requested_properties=["power"])["power"]
         else:
             print("Bulb not connected.")
             return "off"
     
-    def _check_bulb(self) -> None:
-        ''' Check if the bulb is reachable. '''
+    def _check_bulb(self) -> str:
+        ''' Check if the bulb is reachable and return its power state. '''
         try:
-            self.bulb.get_properties()
+            return self.get_power_state()
         except BulbException as e:
             raise ConnectionError(f"Failed to connect the bulb at {self.ip}.") from e
 
@@ -204,7 +347,6 @@ class App(tk.Tk):
 
         self._init_external()   
         self._init_location_variables()  
-        self._init_images()      
         self._init_state_variables()              
         self._bind_keys()        
         self.create_widgets()
@@ -217,7 +359,7 @@ class App(tk.Tk):
         # Bulb state image label  
         self.state_label = ttk.Label(self.mainframe, textvariable=self.bulb_state)
         self.state_label.grid(column=0, row=0, rowspan=3)
-        self.set_bulb_state(self.bulb.get_power_state())
+        self.set_bulb_state(self.bulb.power_state)
 
         # Toggle button
         ttk.Button(self.mainframe, text="Toggle", command=self.toggle_bulb).grid(column=1, row=1)
@@ -254,15 +396,21 @@ class App(tk.Tk):
         self.latitude: str = self.config.loc_config.latitude
         self.longitude: str = self.config.loc_config.longitude
         self.location = tk.StringVar(value=self.config.loc_config.location)
-        self.sunset = tk.StringVar(value=self.http.get_sunset(self.latitude, self.longitude))
+        self.sunset = tk.StringVar(value=SUNSET_PLACEHOLDER)
+        self.sunset_time: time | None = None # parsed sunset, None until it's fetched
+        self._location_request: int = 0 # id of the latest geocoding request, older results are dropped
+        self._turn_on_catch_up: bool = True # whether an already passed turn on time still turns the bulb on once sunset is fetched
+        self.fetch_sunset()
 
     def _init_state_variables(self) -> None:
         # Bulb state
         self.bulb_state = tk.StringVar()
+        self._shown_bulb_state: str | None = None
         self.ip_label = tk.StringVar(value=self.config.network_settings.ip)
 
         # Time
         self.time = tk.StringVar()
+        self._time_str: str = ""
         self.time_update()
         
         # Sunset auto-on
@@ -280,9 +428,18 @@ class App(tk.Tk):
         # Exit behavior
         self.exit_var = tk.IntVar(value=self.config.app_settings.exit_var)
 
+        # Settings window, built on first open
+        self.settings_window: tk.Toplevel | None = None
+
+        # Unsaved configuration changes, defaults count as unsaved until config file is written for the first time
+        self._config_dirty: bool = not self._config_file_found
+        for var in (self.location, self.auto_on_var, self.offset, self.auto_off_var, self.off_time, self.exit_var):
+            var.trace_add("write", self._mark_config_dirty)
+
         # Validation and errors
         self.loc_vcmd: tuple[str, Literal['%P']] = (self.register(self.loc_validate), "%P")
         self.loc_errmsg = tk.StringVar()
+        self._loc_errmsg_text: str = ""
 
         self.ip_vcmd: tuple[str, Literal['%P']] = (self.register(self.ip_validate), "%P")
         self.ip_errmsg = tk.StringVar()
@@ -290,28 +447,53 @@ class App(tk.Tk):
     def _init_external(self) -> None:
         # Configuration manager
         self.config = ConfigManager()
-        self.config.load()
+        self._config_file_found: bool = self.config.load()
         
-        # Bulb controller
-        self.bulb = BulbController(self.config.network_settings.ip, self.set_bulb_state)
+        # Worker threads for blocking network calls, so they don't freeze the UI
+        self._pool = ThreadPoolExecutor(max_workers=2)
+        # Bulb communication gets a single worker, so commands never overlap on the bulb's socket
+        self._bulb_pool = ThreadPoolExecutor(max_workers=1)
+        self._bulb_futures: set[Future] = set() # queued or running bulb tasks, cancelled on exit
+
+        # Bulb controller, connects in the background while sunset is being fetched
+        self._bulb_reachable: bool = True # outcome of the last connection check, unreachable bulb is reported only once
+        self.connect_bulb(self.config.network_settings.ip)
+
+        # Power state is tracked locally, the bulb is only re-read now and then to pick up changes made outside of this app
+        self.refresh_loop = LoopController(self, 60000, self.refresh_bulb_state)
+        self.refresh_loop.start()
 
         # Http requests handler
         self.http = HttpRequests()
 
-        # Loops controller
-        self.turn_on_loop: LoopController | None = None
-        self.turn_off_loop: LoopController | None = None
+        # One-shot timers for scheduled turn on/off
+        self.turn_on_timer = TimerController(self, self.turn_on_task)
+        self.turn_off_timer = TimerController(self, self.turn_off_task)
+        self.sunset_retry_timer = TimerController(self, self.fetch_sunset)
+        self._turn_off_cache: tuple[str, datetime] | None = None # last (off time string, turn off datetime) pair
     
     def _bind_keys(self) -> None:
         self.bind(sequence="<Escape>", func=self.exit)
 
-    def _init_images(self) -> None:
-        self.img_bulb_on = tk.PhotoImage(file="bulb_on.gif")
-        self.img_bulb_off = tk.PhotoImage(file="bulb_off.gif")
+    # Images are loaded on first use, so only the one that is actually shown gets read at startup.
+    @cached_property
+    def img_bulb_on(self) -> tk.PhotoImage:
+        return tk.PhotoImage(file="bulb_on.gif")
+
+    @cached_property
+    def img_bulb_off(self) -> tk.PhotoImage:
+        return tk.PhotoImage(file="bulb_off.gif")
 
     def open_settings_window(self) -> None:
+        ''' Open settings window. It's built on first open, later it's only shown again. '''
+        if self.settings_window is not None:
+            self.settings_window.deiconify()
+            self.settings_window.grab_set()
+            return
+
         self.settings_window = tk.Toplevel(self)
         self.settings_window.title("Settings")
+        self.settings_window.protocol("WM_DELETE_WINDOW", self.close_settings_window)
         self.settings_window.grab_set() # This method routes all events for this application to this widget, so the focus will be on this window.
 
         # IP address text label
@@ -346,14 +528,7 @@ class App(tk.Tk):
         # Auto-off time combobox
         ttk.Label(self.settings_window, text="Set auto-off time:").grid(column=0, row=5, padx=5, pady=3, sticky="w")
         self.cmbbox = ttk.Combobox(self.settings_window, textvariable=self.off_time, width=5)
-        self.cmbbox["values"] = [
-                            str(h)+":0"+str(m)
-                            if m < 10
-                            else
-                            str(h)+":"+str(m)
-                            for h in range(24)
-                            for m in range(0, 60, 10)
-                            ]
+        self.cmbbox["values"] = OFF_TIME_VALUES
         self.cmbbox.state(["readonly"])
         if not self.auto_off_check.instate(["selected"]):
             self.cmbbox.state(["disabled"])
@@ -368,6 +543,7 @@ class App(tk.Tk):
         ttk.Label(self.settings_window, font="TkSmallCaptionFont", foreground="red", textvariable=self.loc_errmsg).grid(column=1, row=7, sticky="w")
         self.loc_btn = ttk.Button(self.settings_window, text="Set", command=self.set_location, state="disabled")
         self.loc_btn.grid(column=2, row=6, padx=5)
+        self._loc_last_valid: bool = False # Matches the initial "disabled" state of the button.
 
         # Exit auto-off checkbutton
         self.exit_auto_off_check = ttk.Checkbutton(self.settings_window, text="Auto-off at exit", variable=self.exit_var)
@@ -377,11 +553,17 @@ class App(tk.Tk):
         ttk.Button(self.settings_window, text="Save config", command=self.save_config).grid(column=2, row=8, padx=5, pady=3)
 
         # Close settings window button
-        ttk.Button(self.settings_window, text="Close", command=self.settings_window.destroy).grid(column=0, row=8, padx=5, pady=3)
+        ttk.Button(self.settings_window, text="Close", command=self.close_settings_window).grid(column=0, row=8, padx=5, pady=3)
+
+    def close_settings_window(self) -> None:
+        ''' Hide settings window, so it can be reused on next open. '''
+        if self.settings_window is not None:
+            self.settings_window.grab_release()
+            self.settings_window.withdraw()
     
     def toggle_bulb(self) -> None:
         # This method is needed because self.bulb instance can change during runtime.
-        self.bulb.toggle()
+        self.run_bulb_command(self.bulb.toggle)
 
     def handle_sunset_turn_on_widgets(self) -> None:
         ''' Change state of spinbox according to sunset turn on checkbox state. Call sunset_turn_on() on every change. '''
@@ -394,29 +576,32 @@ class App(tk.Tk):
             print("Sunset turn on disabled.")
             self.sunset_turn_on()
 
-    def sunset_turn_on(self) -> None:
-        ''' Start the turn on loop and calculate turn on time if auto_on_var is true (int 1), stop the loop if auto_on_var is false (int 0). '''
-        if not self.turn_on_loop:
-            self.turn_on_loop = LoopController(self, 1000, self.turn_on_task)
-
+    def sunset_turn_on(self, catch_up: bool = True) -> None:
+        ''' Calculate turn on time and schedule the turn on task for today if auto_on_var is true (int 1), cancel it if auto_on_var is false (int 0). If turn on time has already passed, the bulb is turned on right away, unless catch_up is false. '''
         if self.auto_on_var.get() == 1:
-            self.turn_on_time: str = add_subtract_minutes(self.sunset.get(), self.offset.get())
-            self.turn_on_loop.start()
+            if self.sunset_time is None:
+                return # Sunset not fetched yet, turn on gets scheduled once it is.
+            self.turn_on_time: datetime = datetime.combine(datetime.now().date(), self.sunset_time) + timedelta(minutes=int(self.offset.get()))
+            if not catch_up and self.turn_on_time <= datetime.now():
+                self.turn_on_timer.cancel()
+                return
+            self.turn_on_timer.schedule(self.turn_on_time)
         else:
-            self.turn_on_loop.stop()
+            self.turn_on_timer.cancel()
     
     def turn_on_task(self) -> None:
-        ''' Turn on the bulb if current time matches scheduled time. '''
-        if datetime.strptime(self.turn_on_time, "%H:%M").time() <= datetime.now().time():
-            self.bulb.turn_on()
-            if self.turn_on_loop:
-                self.turn_on_loop.stop()
-                self.turn_on_loop = None
-            print("Bulb turned on.")
+        ''' Turn on the bulb at scheduled time. '''
+        self.run_bulb_command(self.bulb.turn_on, "Bulb turned on.")
 
     def time_update(self) -> None:
-        self.time.set(datetime.now().strftime("%H:%M"))
-        self.after(1000, self.time_update)
+        ''' Update displayed time (if the minute changed) and schedule next update at the start of the next minute. '''
+        now: datetime = datetime.now()
+        time_str: str = now.strftime("%H:%M")
+        if time_str != self._time_str:
+            self._time_str = time_str
+            self.time.set(time_str)
+        ms_to_next_minute: int = (60 - now.second) * 1000 - now.microsecond // 1000
+        self.after(ms_to_next_minute, self.time_update)
     
     def handle_auto_off_widgets(self) -> None:
         ''' Change state of combobox according to auto-off checkbox state. Call auto_off() on every change. '''
@@ -428,74 +613,215 @@ class App(tk.Tk):
             self.auto_off()
 
     def auto_off(self) -> None:
-        ''' Start the turn off loop and get datetime object corresponding to set turn off time if auto_off_var is true (int 1), stop the loop if auto_off_var is false (int 0). '''
-        if not self.turn_off_loop:
-            self.turn_off_loop = LoopController(self, 1000, self.turn_off_task)
-
+        ''' Get datetime object corresponding to set turn off time and schedule the turn off task if auto_off_var is true (int 1), cancel it if auto_off_var is false (int 0). '''
         if self.auto_off_var.get() == 1:
-            self.turn_off_time: datetime = get_target_datetime(self.off_time.get())
-            self.turn_off_loop.start()
+            self.turn_off_time: datetime = self._get_turn_off_datetime(self.off_time.get())
+            self.turn_off_timer.schedule(self.turn_off_time)
         else:
-            self.turn_off_loop.stop()
+            self.turn_off_timer.cancel()
+
+    def _get_turn_off_datetime(self, off_time: str) -> datetime:
+        ''' Return turn off datetime for given time string. Last result is reused while the time string is unchanged and the datetime is still ahead. '''
+        if self._turn_off_cache and self._turn_off_cache[0] == off_time and self._turn_off_cache[1] > datetime.now():
+            return self._turn_off_cache[1]
+        turn_off_time: datetime = get_target_datetime(off_time)
+        self._turn_off_cache = (off_time, turn_off_time)
+        return turn_off_time
     
     def turn_off_task(self) -> None:
-        ''' Turn off the bulb if current time matches scheduled time. '''
-        if self.turn_off_time <= datetime.now():
-            self.bulb.turn_off()
-            if self.turn_off_loop:
-                self.turn_off_loop.stop()
-                self.turn_off_loop = None
-            print("Bulb turned off.")
+        ''' Turn off the bulb at scheduled time. '''
+        self.run_bulb_command(self.bulb.turn_off, "Bulb turned off.")
     
     def exit(self, *args) -> None:
+        # Drop queued bulb tasks, so exit doesn't wait on refreshes or commands nobody will see the result of
+        for future in list(self._bulb_futures):
+            future.cancel()
         if self.exit_var.get():
-            self.bulb.turn_off()
+            self._bulb_pool.submit(self.bulb.turn_off)
+        self._bulb_pool.shutdown(wait=True) # let the running task and auto-off at exit finish
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self.http.close()
         self.destroy()
 
     def set_bulb_state(self, state: str) -> None:
+        ''' Show bulb's power state. Nothing is redrawn if the state didn't change. '''
+        if state == self._shown_bulb_state:
+            return
+        self._shown_bulb_state = state
         self.bulb_state.set(state)
         self.state_label["image"] = self.img_bulb_on if state == "on" else self.img_bulb_off
 
+    def when_done(self, future: Future, callback: Callable[[Future], None]) -> None:
+        ''' Call callback with the future once it's done. The future is polled from Tk event loop, so callback always runs in the main thread. '''
+        self.after(50, self._poll_future, future, callback)
+
+    def _poll_future(self, future: Future, callback: Callable[[Future], None]) -> None:
+        if future.done():
+            callback(future)
+        else:
+            self.after(50, self._poll_future, future, callback)
+
+    def submit_bulb_task(self, task: Callable[[], None]) -> Future:
+        ''' Queue task on the bulb worker and keep track of it until it's done. '''
+        future: Future = self._bulb_pool.submit(task)
+        self._bulb_futures.add(future)
+        future.add_done_callback(self._bulb_futures.discard)
+        return future
+
+    def connect_bulb(self, ip: str | None) -> None:
+        ''' Create bulb controller for given IP and connect to the bulb in the background. '''
+        self.bulb = BulbController(ip)
+        self.when_done(self.submit_bulb_task(self.bulb.connect), self._apply_bulb_connection)
+
+    def _apply_bulb_connection(self, future: Future) -> None:
+        ''' Show bulb's power state once connected, or an error if the bulb is unreachable. '''
+        try:
+            future.result()
+        except ConnectionError as e:
+            self._bulb_reachable = False
+            messagebox.showerror(title="Connection error", message=str(e))
+            return
+        self._bulb_reachable = True
+        self.set_bulb_state(self.bulb.power_state)
+
+    def refresh_bulb_state(self) -> None:
+        ''' Re-read bulb's power state in the background. '''
+        if self.bulb.ip:
+            self.when_done(self.submit_bulb_task(self.bulb.connect), self._apply_bulb_refresh)
+
+    def _apply_bulb_refresh(self, future: Future) -> None:
+        ''' Show refreshed power state. If the bulb is unreachable keep the last known state. Reachability is printed only when it changes. '''
+        try:
+            future.result()
+        except ConnectionError as e:
+            if self._bulb_reachable:
+                self._bulb_reachable = False
+                print(e)
+            return
+        if not self._bulb_reachable:
+            self._bulb_reachable = True
+            print("Bulb is reachable again.")
+        self.set_bulb_state(self.bulb.power_state)
+
+    def run_bulb_command(self, command: Callable[[], None], done_message: str | None = None) -> None:
+        ''' Run bulb command in the background and show resulting power state. Optional done_message is printed once the command succeeds. '''
+        self.when_done(self.submit_bulb_task(command), partial(self._apply_bulb_command, done_message))
+
+    def _apply_bulb_command(self, done_message: str | None, future: Future) -> None:
+        try:
+            future.result()
+        except BulbException as e:
+            messagebox.showerror(title="Bulb error", message=str(e))
+        else:
+            if done_message:
+                print(done_message)
+        self.set_bulb_state(self.bulb.power_state)
+
+    def fetch_sunset(self) -> None:
+        ''' Fetch sunset time for current coordinates in the background. '''
+        self.sunset_retry_timer.cancel()
+        self.when_done(self._pool.submit(self.http.get_sunset, self.latitude, self.longitude), partial(self._apply_sunset, self.latitude, self.longitude))
+
+    def _apply_sunset(self, latitude: str, longitude: str, future: Future) -> None:
+        ''' Set fetched sunset time and reschedule auto-on, which depends on it. Results for a location that is no longer current are dropped. '''
+        if (latitude, longitude) != (self.latitude, self.longitude):
+            return
+        try:
+            sunset: str = future.result()
+            sunset_time: time = datetime.strptime(sunset, "%H:%M").time()
+        except requests.RequestException as e:
+            self._sunset_failed(f"Failed to fetch sunset time: {e}")
+            return
+        except (KeyError, TypeError, ValueError) as e: # unexpected response body
+            self._sunset_failed(f"Invalid sunset time response: {e!r}")
+            return
+        self.sunset.set(sunset)
+        self.sunset_time = sunset_time
+        if self.auto_on_var.get() == 1:
+            self.sunset_turn_on(catch_up=self._turn_on_catch_up)
+
+    def _sunset_failed(self, message: str) -> None:
+        ''' Show that sunset time is unavailable and retry fetching it later, auto-on can't be scheduled without it. The message is printed only on the first failure in a row. '''
+        if self.sunset.get() != SUNSET_FAILED:
+            print(message + f" Retrying every {SUNSET_RETRY_S} s.")
+            self.sunset.set(SUNSET_FAILED)
+        self.sunset_retry_timer.schedule(datetime.now() + timedelta(seconds=SUNSET_RETRY_S))
+
     def set_location(self) -> None:
+        location: str = self.user_input_loc.get()
+        # Connect to the sunset API while geocoding request is in progress, the sunset fetch follows right after it.
+        # A cached location is resolved instantly, there is nothing to overlap with.
+        if not self.http.is_geocode_cached(location):
+            self._pool.submit(self.http.warm_up_sunset)
+        self._location_request += 1
+        self.when_done(self._pool.submit(self.http.geocode, location), partial(self._apply_location, self._location_request))
+
+    def _apply_location(self, request: int, future: Future) -> None:
+        ''' Show the new location right away and fetch its sunset time in the background. Results of superseded requests are dropped. '''
+        if request != self._location_request:
+            return
         try:
             location: str
-            sunset: str
-            self.latitude, self.longitude, location, sunset = self.http.set_location(self.user_input_loc.get())
-            self.location.set(location)
-            self.sunset.set(sunset)
+            self.latitude, self.longitude, location = future.result()
         except KeyError:
-            self.loc_errmsg.set("Location not found.")
+            self._set_loc_errmsg("Location not found.")
+            return
+        except requests.RequestException:
+            self._set_loc_errmsg("Connection failed.")
+            return
+        self.location.set(location)
+        # Turn on that is still pending carries over to the new location, one that already happened isn't repeated.
+        # If the previous sunset wasn't fetched yet, nothing was scheduled, so the previous decision is kept.
+        if self.sunset_time is not None:
+            self._turn_on_catch_up = self.turn_on_timer.is_scheduled()
+        self.sunset.set(SUNSET_PLACEHOLDER)
+        self.sunset_time = None
+        self.turn_on_timer.cancel() # scheduled for the old location's sunset, rescheduled once the new one is fetched
+        self.fetch_sunset()
 
     def set_ip(self) -> None:
-        self.config.network_settings.ip = self.user_input_ip.get()
-        self.bulb = BulbController(self.config.network_settings.ip, self.set_bulb_state)
+        ip: str = self.user_input_ip.get()
+        if ip != self.bulb.ip: # Keep the already open connection if the IP didn't change.
+            self.config.network_settings.ip = ip
+            self._config_dirty = True
+            self.connect_bulb(ip)
         self.ip_label.set(self.config.network_settings.ip)
         self.ip_entry.delete(0, "end")
         
     def loc_validate(self, new_entry: str) -> bool:
-        self.loc_errmsg.set("")
-        valid: bool = new_entry.isalpha() or new_entry == ""
-        self.loc_btn.state(["!disabled"]) if valid else self.loc_btn.state(["disabled"])
-        if valid:
-            return valid
-        else:
-            self.loc_errmsg.set("Only letters allowed.")
-            return valid
+        ''' Validate location entry on every keystroke. Button state and error message are only changed when they actually differ, to avoid needless Tcl calls. '''
+        valid: bool = new_entry == "" or new_entry.isalpha()
+        if valid != self._loc_last_valid:
+            self._loc_last_valid = valid
+            self.loc_btn.state(["!disabled"] if valid else ["disabled"])
+        self._set_loc_errmsg("" if valid else "Only letters allowed.")
+        return valid
+
+    def _set_loc_errmsg(self, message: str) -> None:
+        ''' Set location error message (if it changed). '''
+        if message != self._loc_errmsg_text:
+            self._loc_errmsg_text = message
+            self.loc_errmsg.set(message)
     
     def ip_validate(self) -> None:
-        valid: re.Match[str] | None = re.fullmatch(r"(\b25[0-5]|\b2[0-4][0-9]|\b[01]?[0-9][0-9]?)(\.(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)){3}", self.user_input_ip.get())
-        if valid:
-            self.set_ip()
-        else:
+        try:
+            ipaddress.IPv4Address(self.user_input_ip.get())
+        except ValueError:
             messagebox.showerror("Invalid IP", "Enter valid IP address.")
+            return
+        self.set_ip()
         
     def update_turn_off_time(self, event: tk.Event) -> None:
-        ''' Set new auto-off time after combobox value change. '''
-        combobox: ttk.Combobox = cast(ttk.Combobox, event.widget)
-        self.turn_off_time: datetime = get_target_datetime(combobox.get())
+        ''' Reschedule the turn off task after combobox value change. '''
+        # Combobox is bound to self.off_time, so auto_off() already sees the new value.
+        self.auto_off()
     
     def save_config(self) -> None:
-        ''' Set configuration attributes at current state and save to file. '''
+        ''' Set configuration attributes at current state and save to file (only if anything changed since last save). '''
+        self.http.save_sunset_cache()
+        if not self._config_dirty:
+            return
+
         self.config.loc_config.location = self.location.get()
         self.config.loc_config.latitude = self.latitude
         self.config.loc_config.longitude = self.longitude
@@ -507,6 +833,10 @@ class App(tk.Tk):
         self.config.app_settings.offset = self.offset.get()
 
         self.config.save()
+        self._config_dirty = False
+
+    def _mark_config_dirty(self, *args) -> None:
+        self._config_dirty = True
         
 if __name__ == '__main__':
     app = App()